@@ -1,11 +1,18 @@
 import streamlit as st
 import folium
+from folium.plugins import Draw
 from streamlit_folium import st_folium
+import base64
+import hashlib
+import io
+
 import numpy as np
+import numba
 import matplotlib.pyplot as plt
+import pydeck as pdk
+from PIL import Image
 from datetime import date
 from shapely.geometry import Polygon
-from scipy.ndimage import zoom
 
 # Sentinel Hub specific imports
 from sentinelhub import (
@@ -22,44 +29,125 @@ from sentinelhub import (
 st.set_page_config(page_title="Live Crop Health Dashboard", layout="wide")
 
 # --- Sentinel Hub Configuration ---
-try:
+NDVI_EVALSCRIPT = """
+//VERSION=3
+function setup() {return {input: ["B04", "B08"], output: { bands: 1, sampleType: "FLOAT32" }};}
+function evaluatePixel(sample) {
+    var den = sample.B08 + sample.B04;
+    return [den == 0 ? 0 : (sample.B08 - sample.B04) / den];
+}
+"""
+
+@st.cache_resource
+def get_sh_config():
     config = SHConfig()
     config.sh_client_id = st.secrets["SH_CLIENT_ID"]
     config.sh_client_secret = st.secrets["SH_CLIENT_SECRET"]
+    return config
+
+try:
+    config = get_sh_config()
 except KeyError:
     st.error("Sentinel Hub credentials not found in secrets.toml!")
     st.stop()
 
 # --- Reusable Functions ---
+@numba.njit(parallel=True, fastmath=True)
+def ndvi_stats(ndvi):
+    """Compute the NDVI health statistics in a single pass over the array.
+
+    Fuses the threshold counts and the vegetation mean so the array is
+    only walked once instead of five times.
+    """
+    healthy_threshold, stressed_threshold = 0.6, 0.2
+    rows, cols = ndvi.shape
+    veg_count, healthy_count, unhealthy_count = 0, 0, 0
+    veg_sum = 0.0
+    for y in numba.prange(rows):
+        for x in range(cols):
+            value = ndvi[y, x]
+            if value > stressed_threshold:
+                veg_count += 1
+                veg_sum += value
+                if value > healthy_threshold:
+                    healthy_count += 1
+            elif value > 0.0:
+                unhealthy_count += 1
+    stressed_count = veg_count - healthy_count
+    avg_ndvi = veg_sum / veg_count if veg_count > 0 else 0.0
+    return healthy_count, stressed_count, unhealthy_count, avg_ndvi
+
 def generate_demo_data(size):
     low_res_h, low_res_w = max(1, size[1] // 20), max(1, size[0] // 20)
     low_res_array = np.random.rand(low_res_h, low_res_w)
-    scale_h, scale_w = size[1] / low_res_h, size[0] / low_res_w
-    high_res_array = zoom(low_res_array, (scale_h, scale_w), order=0)
+    scale_h, scale_w = -(-size[1] // low_res_h), -(-size[0] // low_res_w)
+    high_res_array = np.repeat(np.repeat(low_res_array, scale_h, axis=0), scale_w, axis=1)
+    high_res_array = high_res_array[:size[1], :size[0]]
     return (high_res_array * 1.1) - 0.2
 
-def display_dashboard(ndvi_data):
-    healthy_threshold, stressed_threshold = 0.6, 0.2
-    vegetation_pixels = np.sum(ndvi_data > stressed_threshold)
-    healthy_pixels = np.sum(ndvi_data > healthy_threshold)
-    stressed_pixels = vegetation_pixels - healthy_pixels
-    unhealthy_pixels = np.sum((ndvi_data > 0.0) & (ndvi_data <= stressed_threshold))
+@st.cache_data(ttl=3600, hash_funcs={np.ndarray: lambda a: (a.shape, hashlib.sha1(a.tobytes()).hexdigest())})
+def _ndvi_data_url(ndvi_data):
+    # Block-mean down to ~1024 px on the long edge; the browser displays
+    # roughly that many pixels anyway, so extra resolution is wasted.
+    h, w = ndvi_data.shape
+    s = max(1, max(h, w) // 1024)
+    if s > 1:
+        ndvi_data = ndvi_data[:h - h % s, :w - w % s].reshape(h // s, s, w // s, s).mean(axis=(1, 3))
+    rgba = (plt.get_cmap('RdYlGn')((ndvi_data + 1) / 2) * 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(rgba).save(buffer, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+@st.cache_data(ttl=3600)
+def _render_hist_fig(healthy_pixels, stressed_pixels, unhealthy_pixels):
+    hist_fig, hist_ax = plt.subplots()
+    categories = ['Healthy', 'Stressed', 'Unhealthy']
+    counts = [healthy_pixels, stressed_pixels, unhealthy_pixels]
+    colors = ['#2ca02c', '#ff7f0e', '#d62728']
+    hist_ax.bar(categories, counts, color=colors)
+    hist_ax.set_ylabel('Number of Pixels')
+    return hist_fig
+
+def display_dashboard(ndvi_data, bounds, stats=None):
+    if stats is not None:
+        healthy_pixels, stressed_pixels, unhealthy_pixels, avg_ndvi = stats
+        vegetation_pixels = healthy_pixels + stressed_pixels
+    else:
+        healthy_threshold, stressed_threshold = 0.6, 0.2
+        bins = np.array([0.0, stressed_threshold, healthy_threshold], dtype=ndvi_data.dtype)
+        cats = np.digitize(ndvi_data, bins, right=True)
+        counts = np.bincount(cats.ravel(), minlength=4)
+        unhealthy_pixels, stressed_pixels, healthy_pixels = counts[1], counts[2], counts[3]
+        vegetation_pixels = stressed_pixels + healthy_pixels
+        if vegetation_pixels > 0:
+            veg_sum = np.where(ndvi_data > stressed_threshold, ndvi_data, 0).sum()
+            avg_ndvi = veg_sum / vegetation_pixels
+        else:
+            avg_ndvi = 0
 
     if vegetation_pixels > 0:
         percent_healthy = (healthy_pixels / vegetation_pixels) * 100
         percent_stressed = (stressed_pixels / vegetation_pixels) * 100
-        avg_ndvi = np.mean(ndvi_data[ndvi_data > stressed_threshold])
     else:
-        percent_healthy, percent_stressed, avg_ndvi = 0, 0, 0
-    
+        percent_healthy, percent_stressed = 0, 0
+
     col1, col2 = st.columns([2, 1])
     with col1:
         st.subheader('Generated NDVI Health Map')
-        fig, ax = plt.subplots(figsize=(10, 10))
-        im = ax.imshow(ndvi_data, cmap='RdYlGn', vmin=-1, vmax=1)
-        ax.set_xticks([]); ax.set_yticks([])
-        fig.colorbar(im, ax=ax, fraction=0.046, pad=0.04, label='NDVI Value')
-        st.pyplot(fig)
+        west, south, east, north = bounds
+        ndvi_layer = pdk.Layer(
+            "BitmapLayer",
+            data=None,
+            image=_ndvi_data_url(ndvi_data),
+            bounds=[west, south, east, north],
+        )
+        span = max(east - west, north - south, 1e-4)
+        view_state = pdk.ViewState(
+            longitude=(west + east) / 2,
+            latitude=(south + north) / 2,
+            zoom=min(15, max(1, int(np.log2(360 / span)))),
+        )
+        st.pydeck_chart(pdk.Deck(layers=[ndvi_layer], initial_view_state=view_state))
 
     with col2:
         st.subheader('Data Dashboard')
@@ -70,13 +158,7 @@ def display_dashboard(ndvi_data):
         st.progress(int(percent_stressed))
         st.divider()
         st.write("**Pixel Health Distribution**")
-        hist_fig, hist_ax = plt.subplots()
-        categories = ['Healthy', 'Stressed', 'Unhealthy']
-        counts = [healthy_pixels, stressed_pixels, unhealthy_pixels]
-        colors = ['#2ca02c', '#ff7f0e', '#d62728']
-        hist_ax.bar(categories, counts, color=colors)
-        hist_ax.set_ylabel('Number of Pixels')
-        st.pyplot(hist_fig)
+        st.pyplot(_render_hist_fig(int(healthy_pixels), int(stressed_pixels), int(unhealthy_pixels)))
         st.divider()
         st.subheader("Field Alert")
         if percent_stressed > 30:
@@ -90,28 +172,64 @@ st.write("Search for a location, draw a field, select a date, and get a real-tim
 
 if 'center' not in st.session_state: st.session_state.center = [20.5937, 78.9629] # Centered on India
 if 'zoom' not in st.session_state: st.session_state.zoom = 5
+@st.cache_resource
+def get_geolocator():
+    from geopy.geocoders import Nominatim
+    return Nominatim(user_agent="crop-monitor-app")
+
+@st.cache_data(ttl=86400)
+def geocode(text):
+    return get_geolocator().geocode(text)
+
 search_text = st.text_input("Search for a location", "")
 if search_text:
-    from geopy.geocoders import Nominatim
-    geolocator = Nominatim(user_agent="crop-monitor-app")
-    location = geolocator.geocode(search_text)
+    location = geocode(search_text)
     if location:
         st.session_state.center = [location.latitude, location.longitude]
         st.session_state.zoom = 10
 
 col1_ui, col2_ui = st.columns([2, 1])
+@st.cache_resource
+def build_map(center, zoom):
+    m = folium.Map(location=list(center), zoom_start=zoom)
+    Draw(export=True).add_to(m)
+    return m
+
 with col1_ui:
     st.subheader("Step 1: Select Your Field")
-    m = folium.Map(location=st.session_state.center, zoom_start=st.session_state.zoom)
-    from folium.plugins import Draw
-    Draw(export=True).add_to(m)
-    map_data = st_folium(m, width=700, height=400)
+    m = build_map(tuple(st.session_state.center), st.session_state.zoom)
+    map_data = st_folium(m, width=700, height=400, returned_objects=["last_active_drawing"])
 
 with col2_ui:
     st.subheader("Step 2: Select a Date & Analyze")
     selected_date = st.date_input("Date for satellite imagery", date.today())
     process_button = st.button("Get Field Analysis", type="primary")
 
+@st.cache_data(ttl=86400, max_entries=16)
+def get_ndvi(bbox_tuple, iso_date):
+    """Fetch the server-computed NDVI for an AOI, memoized per (bbox, date)."""
+    aoi_bbox = BBox(bbox=bbox_tuple, crs=CRS.WGS84)
+    aoi_size = bbox_to_dimensions(aoi_bbox, resolution=10)
+    request = SentinelHubRequest(
+        evalscript=NDVI_EVALSCRIPT,
+        input_data=[
+            SentinelHubRequest.input_data(
+                data_collection=DataCollection.SENTINEL2_L2A,
+                time_interval=(iso_date, iso_date),
+                other_args={"dataFilter": {"maxCloudCoverage": 30}},
+            )
+        ],
+        responses=[SentinelHubRequest.output_response("default", MimeType.TIFF)],
+        bbox=aoi_bbox,
+        size=aoi_size,
+        config=get_sh_config(),
+    )
+    response_data = request.get_data()[0]
+    ndvi = np.asarray(response_data, dtype=np.float32)
+    if ndvi.ndim == 3:
+        ndvi = ndvi[:, :, 0]
+    return ndvi
+
 if process_button and map_data and map_data["last_active_drawing"]:
     with st.spinner("Attempting to fetch live satellite data..."):
         aoi_coords = map_data["last_active_drawing"]["geometry"]["coordinates"][0]
@@ -121,35 +239,13 @@ if process_button and map_data and map_data["last_active_drawing"]:
 
         # --- MODIFIED: Try to get live data, but fall back to demo on failure ---
         try:
-            evalscript = """
-            //VERSION=3
-            function setup() {return {input: ["B04", "B08"], output: { bands: 2, sampleType: "FLOAT32" }};}
-            function evaluatePixel(sample) {return [sample.B04, sample.B08];}
-            """
-            request = SentinelHubRequest(
-                evalscript=evalscript,
-                input_data=[
-                    SentinelHubRequest.input_data(
-                        data_collection=DataCollection.SENTINEL2_L2A,
-                        time_interval=(selected_date.isoformat(), selected_date.isoformat()),
-                    )
-                ],
-                responses=[SentinelHubRequest.output_response("default", MimeType.TIFF)],
-                bbox=aoi_bbox,
-                size=aoi_size,
-                config=config,
-            )
-            
-            response_data = request.get_data()[0]
+            ndvi = get_ndvi(aoi_polygon.bounds, selected_date.isoformat())
             st.success("Successfully fetched live satellite data!")
-            red = response_data[:, :, 0].astype('float64')
-            nir = response_data[:, :, 1].astype('float64')
-            ndvi = np.divide((nir - red), (nir + red), where=((nir + red) != 0))
-            display_dashboard(ndvi)
+            display_dashboard(ndvi, aoi_polygon.bounds, stats=ndvi_stats(ndvi))
         except Exception as e:
             st.warning("Live data not available for this date/location. Displaying a demonstration result instead.")
             ndvi = generate_demo_data(aoi_size)
-            display_dashboard(ndvi)
+            display_dashboard(ndvi, aoi_polygon.bounds)
 
 elif process_button:
     st.warning("Please draw an area on the map first.")
\ No newline at end of file